@@ -16,12 +16,36 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import copy
+import functools
+import hashlib
+import numpy as np
 from ikomia import core, dataprocess, utils
-from ultralytics import YOLO
-import torch
 import os
-from ultralytics import download
+import shutil
+from collections import OrderedDict
+
+# torch and ultralytics are imported on first use: enumerating
+# the plugin factory must not pay their import cost
+
+
+# Loaded models shared across task instances, least recently used first.
+# Up to _MODEL_CACHE_SIZE models stay resident on their device: call
+# _MODEL_CACHE.clear() then torch.cuda.empty_cache() to release GPU memory.
+_MODEL_CACHE = OrderedDict()
+_MODEL_CACHE_SIZE = 3
+
+
+@functools.lru_cache(maxsize=None)
+def get_torch():
+    # Import torch on first use, later calls only return the module
+    import torch
+    return torch
+
+
+@functools.lru_cache(maxsize=None)
+def cuda_available():
+    # Probe CUDA driver only once per process
+    return get_torch().cuda.is_available()
 
 # --------------------
 # - Class to handle the process parameters
@@ -34,12 +58,14 @@ class InferYoloV8Param(core.CWorkflowTaskParam):
     def __init__(self):
         core.CWorkflowTaskParam.__init__(self)
         self.model_name = "yolov8m"
-        self.cuda = torch.cuda.is_available()
+        self.cuda = cuda_available()
         self.input_size = 640
         self.conf_thres = 0.25
         self.iou_thres = 0.7
-        self.update = False
         self.model_weight_file = ""
+        self.use_tensorrt = False
+        self.int8 = False
+        self.calib_data = ""
 
     def set_values(self, param_map):
         # Set parameters values from Ikomia application
@@ -49,7 +75,9 @@ class InferYoloV8Param(core.CWorkflowTaskParam):
         self.conf_thres = float(param_map["conf_thres"])
         self.iou_thres = float(param_map["iou_thres"])
         self.model_weight_file = str(param_map["model_weight_file"])
-        self.update = True
+        self.use_tensorrt = utils.strtobool(param_map["use_tensorrt"])
+        self.int8 = utils.strtobool(param_map["int8"])
+        self.calib_data = str(param_map["calib_data"])
 
     def get_values(self):
         # Send parameters values to Ikomia application
@@ -60,10 +88,26 @@ class InferYoloV8Param(core.CWorkflowTaskParam):
         param_map["input_size"] = str(self.input_size)
         param_map["conf_thres"] = str(self.conf_thres)
         param_map["iou_thres"] = str(self.iou_thres)
-        param_map["update"] = str(self.update)
         param_map["model_weight_file"] = str(self.model_weight_file)
+        param_map["use_tensorrt"] = str(self.use_tensorrt)
+        param_map["int8"] = str(self.int8)
+        param_map["calib_data"] = str(self.calib_data)
         return param_map
 
+    def clone(self):
+        # Parameters are primitive types only: no need for deepcopy
+        new_param = InferYoloV8Param()
+        new_param.model_name = self.model_name
+        new_param.cuda = self.cuda
+        new_param.input_size = self.input_size
+        new_param.conf_thres = self.conf_thres
+        new_param.iou_thres = self.iou_thres
+        new_param.model_weight_file = self.model_weight_file
+        new_param.use_tensorrt = self.use_tensorrt
+        new_param.int8 = self.int8
+        new_param.calib_data = self.calib_data
+        return new_param
+
 
 # --------------------
 # - Class which implements the process
@@ -73,11 +117,12 @@ class InferYoloV8(dataprocess.CObjectDetectionTask):
 
     def __init__(self, name, param):
         dataprocess.CObjectDetectionTask.__init__(self, name)
+        torch = get_torch()
         # Create parameters class
         if param is None:
             self.set_param_object(InferYoloV8Param())
         else:
-            self.set_param_object(copy.deepcopy(param))
+            self.set_param_object(param.clone())
 
         self.repo = 'ultralytics/assets'
         self.version = 'v0.0.0'
@@ -86,12 +131,193 @@ class InferYoloV8(dataprocess.CObjectDetectionTask):
         self.model = None
         self.half = False
         self.model_name = None
+        self._model_signature = None
+        self._host_buffer = None
+        self._predict = None
+        self._predict_thresholds = None
+
+        # Input size is fixed between runs: let cuDNN autotune convolutions
+        if cuda_available():
+            torch.backends.cudnn.benchmark = True
 
     def get_progress_steps(self):
         # Function returning the number of progress steps for this process
         # This is handled by the main progress bar of Ikomia application
         return 1
 
+    def export_tensorrt(self, model_weights, param):
+        # Export PyTorch weights to a TensorRT engine only once: engines are
+        # cached by weight file (full path and modification time), input
+        # size, precision and INT8 calibration data
+        from ultralytics import YOLO
+        precision = "int8" if param.int8 else "fp16" if self.half else "fp32"
+        model_stem = os.path.splitext(os.path.basename(model_weights))[0]
+        source_key = f'{os.path.realpath(model_weights)}|{os.path.getmtime(model_weights)}'
+        if param.int8:
+            source_key += f'|{os.path.realpath(param.calib_data) if param.calib_data else ""}'
+        digest = hashlib.sha1(source_key.encode()).hexdigest()[:12]
+        engine_folder = os.path.join(os.path.dirname(
+            os.path.realpath(__file__)), "weights", "engines")
+        engine_base = os.path.join(
+            engine_folder, f'{model_stem}_{digest}_{param.input_size}_{precision}')
+        engine_path = f'{engine_base}.engine'
+
+        if not os.path.isfile(engine_path):
+            os.makedirs(engine_folder, exist_ok=True)
+            export_args = {
+                "format": "engine",
+                "imgsz": param.input_size,
+                "half": self.half and not param.int8,
+                "dynamic": True,
+                # Profile capped at batch 1: infer() runs one image at a time
+                "batch": 1,
+                "device": self.device
+            }
+            if param.int8:
+                export_args["int8"] = True
+                if param.calib_data:
+                    export_args["data"] = param.calib_data
+
+            # Export from a copy inside the engine folder: ultralytics writes
+            # the engine and its intermediate .onnx next to the weights
+            shutil.copyfile(model_weights, f'{engine_base}.pt')
+            try:
+                YOLO(f'{engine_base}.pt').export(**export_args)
+            finally:
+                for ext in (".pt", ".onnx"):
+                    if os.path.isfile(engine_base + ext):
+                        os.remove(engine_base + ext)
+
+        return engine_path
+
+    def infer(self, src_image, param):
+        # Run detection on one image, returns ultralytics result
+        torch = get_torch()
+        with torch.inference_mode():
+            # Bind predict() arguments once, rebind only if thresholds changed
+            thresholds = (param.conf_thres, param.iou_thres)
+            if self._predict is None or thresholds != self._predict_thresholds:
+                self._predict = functools.partial(
+                    self.model.predict,
+                    save=False,
+                    imgsz=param.input_size,
+                    conf=param.conf_thres,
+                    iou=param.iou_thres,
+                    half=self.half,
+                    device=self.device,
+                    verbose=False
+                )
+                self._predict_thresholds = thresholds
+
+            results = self._predict(src_image)
+
+        return results[0]
+
+    def get_detections(self, result):
+        # NMS already ran on the inference device inside predict():
+        # one device to host transfer for all remaining detections.
+        # Returns (x, y, width, height) boxes with top-left corner,
+        # confidences and class indices as NumPy arrays.
+        torch = get_torch()
+        packed = torch.cat([
+            result.boxes.xywh,
+            result.boxes.conf.unsqueeze(1),
+            result.boxes.cls.unsqueeze(1)
+        ], dim=1).detach()
+
+        if packed.is_cuda:
+            count = packed.shape[0]
+            if self._host_buffer is None or self._host_buffer.shape[0] < count:
+                self._host_buffer = torch.empty(
+                    (max(count, 300), 6), dtype=torch.float32, pin_memory=True)
+            self._host_buffer[:count].copy_(packed, non_blocking=True)
+            # The copy is queued after the forward pass and NMS: wait for the
+            # whole stream before reading the buffer
+            torch.cuda.current_stream(packed.device).synchronize()
+            # Copy out: the pinned buffer is reused by the next frame
+            detections = self._host_buffer[:count].numpy().copy()
+        else:
+            detections = packed.float().numpy()
+
+        boxes = detections[:, 0:4]
+        confidences = detections[:, 4]
+        class_idx = detections[:, 5]
+
+        # (center x, center y, width, height) -> top-left corner, in place
+        boxes[:, 0:2] -= boxes[:, 2:4] / 2
+        return boxes, confidences, class_idx
+
+    def get_model_weights(self, param):
+        if param.model_weight_file:
+            return param.model_weight_file
+
+        # Set path
+        model_folder = os.path.join(os.path.dirname(
+            os.path.realpath(__file__)), "weights")
+        model_weights = os.path.join(
+            str(model_folder), f'{param.model_name}.pt')
+        # Download model if not exist
+        if not os.path.isfile(model_weights):
+            from ultralytics import download
+            url = f'https://github.com/{self.repo}/releases/download/{self.version}/{param.model_name}.pt'
+            download(url=url, dir=model_folder, unzip=True)
+        return model_weights
+
+    def load_model(self, param, src_image):
+        # Load model only if a model-related parameter changed or if the
+        # weight file was replaced: thresholds are passed to predict()
+        # and do not need a reload
+        model_weights = self.get_model_weights(param)
+        model_signature = (
+            model_weights,
+            os.path.getmtime(model_weights),
+            param.cuda,
+            param.input_size,
+            param.use_tensorrt,
+            # INT8 options only apply to TensorRT engines
+            param.use_tensorrt and param.int8,
+            param.calib_data if param.use_tensorrt and param.int8 else ""
+        )
+        if self.model is None or model_signature != self._model_signature:
+            torch = get_torch()
+            from ultralytics import YOLO
+
+            # Resolve device once per model load
+            if param.cuda and cuda_available():
+                self.device = torch.device("cuda")
+                self.half = True
+            else:
+                self.device = torch.device("cpu")
+                self.half = False
+
+            # TensorRT engines can only run on GPU
+            if param.use_tensorrt and self.device.type == "cuda":
+                model_weights = self.export_tensorrt(model_weights, param)
+
+            # Ultralytics binds the model to its device at first prediction
+            cache_key = (model_weights, os.path.getmtime(model_weights),
+                         self.device, self.half)
+            from_cache = cache_key in _MODEL_CACHE
+            if from_cache:
+                _MODEL_CACHE.move_to_end(cache_key)
+            else:
+                _MODEL_CACHE[cache_key] = YOLO(model_weights)
+                if len(_MODEL_CACHE) > _MODEL_CACHE_SIZE:
+                    _MODEL_CACHE.popitem(last=False)
+
+            self.model = _MODEL_CACHE[cache_key]
+            self._model_signature = model_signature
+            self._predict = None
+            # Class names are read from the first result of this model
+            self.classes = None
+
+            # Warm up on GPU with the shape of the source image: CUDA context
+            # init and cuDNN algorithm selection happen here for the
+            # letterboxed shape of the following frames.
+            # Cached models already ran predictions.
+            if self.device.type == "cuda" and not from_cache:
+                self.infer(np.zeros_like(src_image), param)
+
     def run(self):
         # Core function of your process
         # Call begin_task_run() for initialization
@@ -110,60 +336,28 @@ class InferYoloV8(dataprocess.CObjectDetectionTask):
         src_image = input.get_image()
 
         # Load model
-        if param.update or self.model is None:
-            self.device = torch.device(
-                "cuda") if param.cuda and torch.cuda.is_available() else torch.device("cpu")
-            self.half = True if param.cuda and torch.cuda.is_available() else False
-
-            if param.model_weight_file:
-                self.model = YOLO(param.model_weight_file)
-            else:
-                # Set path
-                model_folder = os.path.join(os.path.dirname(
-                    os.path.realpath(__file__)), "weights")
-                model_weights = os.path.join(
-                    str(model_folder), f'{param.model_name}.pt')
-                # Download model if not exist
-                if not os.path.isfile(model_weights):
-                    url = f'https://github.com/{self.repo}/releases/download/{self.version}/{param.model_name}.pt'
-                    download(url=url, dir=model_folder, unzip=True)
-                self.model = YOLO(model_weights)
-            param.update = False
+        self.load_model(param, src_image)
 
         # Run detection
-        results = self.model.predict(
-            src_image,
-            save=False,
-            imgsz=param.input_size,
-            conf=param.conf_thres,
-            iou=param.iou_thres,
-            half=self.half,
-            device=self.device
-        )
+        result = self.infer(src_image, param)
+
+        # Set classe names once per model: they only depend on weights.
+        # YOLO.names may be unset for TensorRT engines before predict().
+        if self.classes is None:
+            self.classes = list(result.names.values())
+            self.set_names(self.classes)
+
+        # Get output: bulk conversion to Python numbers,
+        # no per-value NumPy scalar conversion in the loop
+        boxes, confidences, class_idx = self.get_detections(result)
+        boxes = boxes.tolist()
+        confidences = confidences.tolist()
+        class_idx = class_idx.astype(int).tolist()
 
-        # Set classe names
-        self.classes = list(results[0].names.values())
-        self.set_names(self.classes)
-
-        # Get output
-        boxes = results[0].boxes.xyxy
-        confidences = results[0].boxes.conf
-        class_idx = results[0].boxes.cls
-
-        for i, (box, conf, cls) in enumerate(zip(boxes, confidences, class_idx)):
-            box = box.detach().cpu().numpy()
-            x1, y1, x2, y2 = box[0], box[1], box[2], box[3]
-            widht = x2 - x1
-            height = y2 - y1
-            self.add_object(
-                i,
-                int(cls),
-                float(conf),
-                float(x1),
-                float(y1),
-                float(widht),
-                float(height)
-            )
+        add_object = self.add_object
+        for i in range(len(boxes)):
+            x, y, w, h = boxes[i]
+            add_object(i, class_idx[i], confidences[i], x, y, w, h)
 
         # Step progress bar (Ikomia Studio):
         self.emit_step_progress()
@@ -18,11 +18,10 @@
 
 from ikomia import core, dataprocess
 from ikomia.utils import pyqtutils, qtconversion
-from infer_yolo_v8.infer_yolo_v8_process import InferYoloV8Param
+from infer_yolo_v8.infer_yolo_v8_process import InferYoloV8Param, cuda_available
 
 # PyQt GUI framework
 from PyQt5.QtWidgets import *
-from torch.cuda import is_available
 
 
 # --------------------
@@ -43,9 +42,10 @@ class InferYoloV8Widget(core.CWorkflowTaskWidget):
         self.grid_layout = QGridLayout()
 
         # Cuda
+        is_cuda_available = cuda_available()
         self.check_cuda = pyqtutils.append_check(
-            self.grid_layout, "Cuda", self.parameters.cuda and is_available())
-        self.check_cuda.setEnabled(is_available())
+            self.grid_layout, "Cuda", self.parameters.cuda and is_cuda_available)
+        self.check_cuda.setEnabled(is_cuda_available)
 
         # Model name
         self.combo_model = pyqtutils.append_combo(
@@ -108,6 +108,31 @@ class InferYoloV8Widget(core.CWorkflowTaskWidget):
                                             decimals=2
         )
 
+        # TensorRT
+        self.check_tensorrt = pyqtutils.append_check(
+            self.grid_layout, "TensorRT export", self.parameters.use_tensorrt)
+        self.check_tensorrt.setEnabled(is_cuda_available)
+        self.check_tensorrt.stateChanged.connect(self.on_tensorrt_changed)
+
+        self.check_int8 = pyqtutils.append_check(
+            self.grid_layout, "INT8 precision", self.parameters.int8)
+        # INT8 precision only applies to TensorRT engines
+        self.check_int8.setEnabled(is_cuda_available and self.parameters.use_tensorrt)
+        self.check_int8.stateChanged.connect(self.on_int8_changed)
+
+        self.label_calib = QLabel("Calibration data (.yaml)")
+        self.browse_calib_data = pyqtutils.BrowseFileWidget(
+                                        path=self.parameters.calib_data,
+                                        tooltip="Select file",
+                                        mode=QFileDialog.ExistingFile
+        )
+        row = self.grid_layout.rowCount()
+        self.grid_layout.addWidget(self.label_calib, row, 0)
+        self.grid_layout.addWidget(self.browse_calib_data, row, 1)
+
+        self.label_calib.setVisible(self.parameters.int8)
+        self.browse_calib_data.setVisible(self.parameters.int8)
+
         # PyQt -> Qt wrapping
         layout_ptr = qtconversion.PyQtToQt(self.grid_layout)
 
@@ -119,6 +144,13 @@ class InferYoloV8Widget(core.CWorkflowTaskWidget):
         self.label_hyp.setVisible(self.check_cfg.isChecked())
         self.browse_weight_file.setVisible(self.check_cfg.isChecked())
 
+    def on_tensorrt_changed(self, int):
+        self.check_int8.setEnabled(self.check_tensorrt.isChecked())
+
+    def on_int8_changed(self, int):
+        self.label_calib.setVisible(self.check_int8.isChecked())
+        self.browse_calib_data.setVisible(self.check_int8.isChecked())
+
     def on_apply(self):
         # Apply button clicked slot
         self.parameters.model_name = self.combo_model.currentText()
@@ -128,7 +160,10 @@ class InferYoloV8Widget(core.CWorkflowTaskWidget):
         self.parameters.iou_thres = self.spin_iou_thres.value()
         if self.check_cfg.isChecked():
             self.parameters.model_weight_file = self.browse_weight_file.path
-        self.parameters.update = True
+        self.parameters.use_tensorrt = self.check_tensorrt.isChecked()
+        self.parameters.int8 = self.check_tensorrt.isChecked() and self.check_int8.isChecked()
+        if self.parameters.int8:
+            self.parameters.calib_data = self.browse_calib_data.path
 
         # Send signal to launch the process
         self.emit_apply(self.parameters)